@@ -0,0 +1,216 @@
+# admin_cli.py
+#
+# Admin tools for the bot:
+#   python admin_cli.py chat-id                 print the ID of any group/channel that messages the bot
+#   python admin_cli.py probe -n 20             time every dependency the bot talks to
+#   python admin_cli.py probe --only stripe,isgd --stripe-base-url http://localhost:12111
+#   python admin_cli.py snapshot-sync           pull sheet changes into the local analytics snapshot
+#   python admin_cli.py stats --by month --status Active
+import argparse
+import asyncio
+import inspect
+import math
+import os
+import time
+
+import pyshorteners
+import stripe
+from dotenv import load_dotenv
+from telegram import Bot, Update
+from telegram.ext import Application, CallbackContext, MessageHandler, filters
+
+load_dotenv()
+BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
+CHANNEL_ID = os.getenv("CHANNEL_ID")
+
+PROBE_NAMES = ("getMe", "getChat", "stripe", "sheets", "isgd", "geocoder")
+
+# ------------------------------------------------------------------------------
+# 1) CHAT ID LOOKUP
+# ------------------------------------------------------------------------------
+async def print_chat_id(update: Update, context: CallbackContext):
+    if update.message:
+        chat_id = update.message.chat_id  # Works for groups
+    elif update.channel_post:
+        chat_id = update.channel_post.chat_id  # Works for channels
+    else:
+        print("❌ No valid chat data found.")
+        return
+
+    print(f"Chat ID: {chat_id}")  # Print in console
+    await update.effective_message.reply_text(f"Chat ID: `{chat_id}`", parse_mode="Markdown")
+
+def run_chat_id(args):
+    app = Application.builder().token(BOT_TOKEN).build()
+    app.add_handler(MessageHandler(filters.ALL, print_chat_id))
+    print("Bot is running... Send a message in your channel/group to get the Chat ID.")
+    app.run_polling()
+
+# ------------------------------------------------------------------------------
+# 2) DEPENDENCY LATENCY PROBES
+# ------------------------------------------------------------------------------
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_samples) - 1, math.ceil(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+def selected_probes(args):
+    selected = args.only.split(",") if args.only else list(PROBE_NAMES)
+    skipped = args.skip.split(",") if args.skip else []
+    return [name for name in selected if name in PROBE_NAMES and name not in skipped]
+
+def build_probes(args, bot):
+    """
+    Returns {name: zero-arg callable} for each selected dependency, pointed
+    at local stand-ins where a base URL was given. `bot` is None when the
+    Bot API is skipped or unreachable.
+    """
+    probes = {}
+    if bot:
+        probes["getMe"] = bot.get_me
+        probes["getChat"] = lambda: bot.get_chat(CHANNEL_ID)
+
+    stripe.api_key = STRIPE_API_KEY
+    if args.stripe_base_url:
+        stripe.api_base = args.stripe_base_url
+    probes["stripe"] = lambda: stripe.Subscription.list(limit=1)
+
+    if "sheets" in selected_probes(args):
+        from google_sheets import SHEET_TAB, init_sheet
+        # Authenticate up front so OAuth and init_sheet aren't part of any sample
+        try:
+            spreadsheet = init_sheet().spreadsheet
+            # Fetches fresh sheet metadata, which is where row_count comes from
+            probes["sheets"] = lambda: spreadsheet.worksheet(SHEET_TAB).row_count
+        except Exception as e:
+            print(f"⚠️ Could not open the sheet, skipping its probe: {e}")
+
+    # Shortener builds a new backend on every attribute access, so hold onto one
+    isgd = pyshorteners.Shortener().isgd
+    if args.isgd_url:
+        isgd.api_url = args.isgd_url
+    probes["isgd"] = lambda: isgd.short("https://example.com/dmo-latency-probe")
+
+    from checks import country_codes
+    probes["geocoder"] = lambda: country_codes([(40.7128, -74.0060)])
+
+    return {name: probes[name] for name in selected_probes(args) if name in probes}
+
+async def time_probe(probe, iterations, warmup):
+    """
+    Runs a probe warmup + iterations times; returns (latencies in ms, errors)
+    for the measured iterations only.
+    """
+    latencies = []
+    errors = []
+    for i in range(warmup + iterations):
+        measured = i >= warmup
+        started = time.perf_counter()
+        try:
+            result = probe()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            if measured:
+                errors.append(str(e))
+            continue
+        if measured:
+            latencies.append((time.perf_counter() - started) * 1000)
+    return sorted(latencies), errors
+
+async def run_probes(args):
+    bot = None
+    if {"getMe", "getChat"} & set(selected_probes(args)):
+        base_url = args.telegram_base_url or "https://api.telegram.org/bot"
+        bot = Bot(BOT_TOKEN, base_url=base_url)
+        try:
+            await bot.initialize()
+        except Exception as e:
+            print(f"⚠️ Could not reach the Bot API, skipping its probes: {e}")
+            bot = None
+    try:
+        probes = build_probes(args, bot)
+        print(f"Probing {', '.join(probes)} ({args.iterations} iterations, {args.warmup} warmup)\n")
+        print(f"{'probe':<10} {'ok':>4} {'err':>4} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  (ms)")
+        for name, probe in probes.items():
+            latencies, errors = await time_probe(probe, args.iterations, args.warmup)
+            if latencies:
+                stats = [percentile(latencies, p) for p in (50, 90, 99)] + [latencies[-1]]
+                cells = " ".join(f"{value:>9.1f}" for value in stats)
+            else:
+                cells = " ".join(f"{'-':>9}" for _ in range(4))
+            print(f"{name:<10} {len(latencies):>4} {len(errors):>4} {cells}")
+            if errors:
+                print(f"{'':<10} ⚠️ last error: {errors[-1]}")
+    finally:
+        if bot:
+            await bot.shutdown()
+
+def run_probe(args):
+    asyncio.run(run_probes(args))
+
+# ------------------------------------------------------------------------------
+# 3) SUBSCRIBER ANALYTICS (local sheet snapshot)
+# ------------------------------------------------------------------------------
+def run_snapshot_sync(args):
+    from google_sheets import init_sheet
+    from sheet_snapshot import sync
+    sync(init_sheet(), full=args.full)
+
+def run_stats(args):
+    from sheet_snapshot import SheetSnapshot, count, group_by
+    snapshot = SheetSnapshot.load()
+    if not snapshot.synced_rows:
+        print("No sheet snapshot yet, run `python admin_cli.py snapshot-sync` first.")
+        return
+    started = time.perf_counter()
+    if args.by:
+        result = group_by(snapshot, args.by, status=args.status, sub_type=args.sub_type)
+    else:
+        result = {"subscribers": count(snapshot, status=args.status, sub_type=args.sub_type)}
+    elapsed = (time.perf_counter() - started) * 1000
+    for key, value in result.items():
+        print(f"{key:<24} {value:>8}")
+    print(f"\n({elapsed:.1f} ms, snapshot synced at {time.ctime(snapshot.synced_at)})")
+
+# ------------------------------------------------------------------------------
+# 4) ENTRY POINT
+# ------------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="DMO Telegram bot admin tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    chat_id_parser = commands.add_parser("chat-id", help="print the ID of chats that message the bot")
+    chat_id_parser.set_defaults(func=run_chat_id)
+
+    probe_parser = commands.add_parser("probe", help="time requests to every dependency")
+    probe_parser.add_argument("-n", "--iterations", type=int, default=10)
+    probe_parser.add_argument("--warmup", type=int, default=1, help="untimed calls before measuring")
+    probe_parser.add_argument("--only", help=f"comma-separated subset of: {', '.join(PROBE_NAMES)}")
+    probe_parser.add_argument("--skip", help="comma-separated probes to leave out")
+    probe_parser.add_argument("--telegram-base-url", help="e.g. http://localhost:8081/bot for a local Bot API server")
+    probe_parser.add_argument("--stripe-base-url", help="e.g. http://localhost:12111 for stripe-mock")
+    probe_parser.add_argument("--isgd-url", help="stand-in for https://is.gd/create.php")
+    probe_parser.set_defaults(func=run_probe)
+
+    sync_parser = commands.add_parser("snapshot-sync", help="pull sheet changes into the local snapshot")
+    sync_parser.add_argument("--full", action="store_true", help="rebuild instead of syncing incrementally")
+    sync_parser.set_defaults(func=run_snapshot_sync)
+
+    stats_parser = commands.add_parser("stats", help="count subscribers from the local snapshot")
+    stats_parser.add_argument(
+        "--by", choices=("status", "sub_type", "month", "churn_month"),
+        help="month = month of DateStarted; churn_month = month a snapshot-sync first saw the "
+             "row turn Cancelled/Payment Failed (not the actual cancellation date; rows already "
+             "churned at the first sync show as 'unknown')",
+    )
+    stats_parser.add_argument("--status", help='only rows with this status, e.g. "Active"')
+    stats_parser.add_argument("--sub-type", help='only rows with this sub type, e.g. "Subscription"')
+    stats_parser.set_defaults(func=run_stats)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import time
+
+from telegram import Bot
+from telegram.error import (BadRequest, Forbidden, NetworkError, RetryAfter,
+                            TelegramError, TimedOut)
+
+from google_sheets import iter_telegram_ids
+from rate_limiter import RateLimiter, bot_api_limiter
+from state_store import warn_if_ephemeral
+
+# Each broadcast is two files in BROADCAST_DIR:
+#   <id>.json          {"id", "text", "created_at", "done", "counts"}
+#   <id>.results.jsonl one {"telegram_id", "status", "error", "at"} line per recipient
+# The results log doubles as the checkpoint: on resume, anyone already in it is skipped.
+# Resuming only works if BROADCAST_DIR outlives the process (see state_store.warn_if_ephemeral).
+BROADCAST_DIR = os.getenv("BROADCAST_DIR", "broadcasts")
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "20"))
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "500"))
+MAX_ATTEMPTS = 5
+
+# Members who should still get messages
+ACTIVE_STATUSES = ("Active", "Cancel at Period End")
+
+
+def _meta_path(broadcast_id):
+    return os.path.join(BROADCAST_DIR, f"{broadcast_id}.json")
+
+
+def _results_path(broadcast_id):
+    return os.path.join(BROADCAST_DIR, f"{broadcast_id}.results.jsonl")
+
+
+def _write_meta(meta):
+    tmp_path = f"{_meta_path(meta['id'])}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, _meta_path(meta["id"]))
+
+
+def load_meta(broadcast_id):
+    with open(_meta_path(broadcast_id), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_results(broadcast_id):
+    """Returns {telegram_id (str): status} for everyone already handled."""
+    results = {}
+    path = _results_path(broadcast_id)
+    if not os.path.exists(path):
+        return results
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crash mid-write
+            results[record["telegram_id"]] = record["status"]
+    return results
+
+
+def create_broadcast(text):
+    """Registers a new broadcast on disk and returns its ID."""
+    os.makedirs(BROADCAST_DIR, exist_ok=True)
+    warn_if_ephemeral("BROADCAST_DIR", "The broadcast checkpoint")
+    broadcast_id = f"bc-{time.time_ns()}"
+    _write_meta({"id": broadcast_id, "text": text, "created_at": int(time.time()), "done": False})
+    return broadcast_id
+
+
+def unfinished_broadcasts():
+    """IDs of broadcasts that were interrupted before they finished."""
+    if not os.path.isdir(BROADCAST_DIR):
+        return []
+    broadcast_ids = []
+    for name in sorted(os.listdir(BROADCAST_DIR)):
+        if name.endswith(".json"):
+            meta = load_meta(name[:-len(".json")])
+            if not meta.get("done"):
+                broadcast_ids.append(meta["id"])
+    return broadcast_ids
+
+
+async def deliver(bot: Bot, limiter: RateLimiter, telegram_id: str, text: str):
+    """
+    Sends one message, backing off on flood control. Returns (status, error).
+    Timeouts are not retried: the message may already have been delivered.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        await limiter.acquire()
+        try:
+            await bot.send_message(chat_id=int(telegram_id), text=text)
+            return "sent", None
+        except RetryAfter as e:
+            print(f"⏳ Flood control, pausing broadcast for {e.retry_after}s")
+            limiter.pause(e.retry_after)
+            error = str(e)
+        except Forbidden as e:
+            return "blocked", str(e)  # they blocked the bot or deleted their account
+        except BadRequest as e:
+            return "failed", str(e)
+        except TimedOut as e:
+            return "failed (timeout)", str(e)
+        except NetworkError as e:
+            # Other network errors, e.g. the connection could not be opened
+            await asyncio.sleep(attempt)
+            error = str(e)
+        except TelegramError as e:
+            return "failed", str(e)
+    return "failed", error
+
+
+async def run_broadcast(bot: Bot, sheet, broadcast_id: str):
+    """
+    Streams active Telegram IDs from the sheet and sends the broadcast text
+    to each through BROADCAST_WORKERS concurrent senders sharing bot_api_limiter.
+    Safe to call again on an interrupted broadcast: it picks up where it stopped.
+    """
+    meta = load_meta(broadcast_id)
+    already_done = load_results(broadcast_id)
+    limiter = bot_api_limiter
+    queue = asyncio.Queue(maxsize=BROADCAST_WORKERS * 4)
+    counts = {}
+    if already_done:
+        print(f"♻️ Resuming broadcast {broadcast_id}, {len(already_done)} recipient(s) already done")
+
+    async def produce():
+        chunks = iter_telegram_ids(sheet, ACTIVE_STATUSES, BROADCAST_CHUNK_SIZE)
+        seen = set(already_done)
+        while True:
+            # gspread blocks, so read each chunk off the event loop
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            for telegram_id in chunk:
+                if telegram_id not in seen:
+                    seen.add(telegram_id)
+                    await queue.put(telegram_id)
+        for _ in range(BROADCAST_WORKERS):
+            await queue.put(None)
+
+    async def work(results_file):
+        while True:
+            telegram_id = await queue.get()
+            if telegram_id is None:
+                return
+            status, error = await deliver(bot, limiter, telegram_id, meta["text"])
+            counts[status] = counts.get(status, 0) + 1
+            results_file.write(json.dumps({
+                "telegram_id": telegram_id, "status": status, "error": error, "at": int(time.time())
+            }) + "\n")
+
+    print(f"📣 Broadcast {broadcast_id} running...")
+    # Line buffered, so every result hits the file as soon as it's known
+    with open(_results_path(broadcast_id), "a", encoding="utf-8", buffering=1) as results_file:
+        tasks = [asyncio.ensure_future(produce())]
+        tasks += [asyncio.ensure_future(work(results_file)) for _ in range(BROADCAST_WORKERS)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # If the sheet read fails, don't leave workers waiting on the queue
+            for task in tasks:
+                task.cancel()
+
+    for status in already_done.values():
+        counts[status] = counts.get(status, 0) + 1
+    meta["done"] = True
+    meta["counts"] = counts
+    _write_meta(meta)
+    print(f"✅ Broadcast {broadcast_id} finished: {counts}")
+    return counts
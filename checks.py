@@ -1,8 +1,82 @@
 import reverse_geocoder as rg
 
+EU_COUNTRIES = (
+    "AT", "BE", "BG", "CY", "CZ", "DE", "DK", "EE", "ES", "FI", "FR", "GR", "HR", "HU",
+    "IE", "IT", "LT", "LU", "LV", "MT", "NL", "PL", "PT", "RO", "SE", "SI", "SK",
+)
 
-def check_if_in_usa(latitude, longitude):
-    # Reverse geocode the coordinates; returns a list of dictionaries.
-    result = rg.search((latitude, longitude))[0]
-    # The 'cc' key contains the country code, e.g., "US" for United States.
-    return result.get("cc") != "US"
+# Country code -> region name, so one price table entry can cover a whole region
+COUNTRY_REGIONS = {cc: "EU" for cc in EU_COUNTRIES}
+
+# Telegram ID (str) -> {"cc", "cell"} from that user's last geocoded location.
+# Prices are looked up from the country at request time, so price table
+# changes apply straight away.
+COUNTRY_CACHE = {}
+# Locations are only kept as a grid cell this many degrees wide (roughly 50km),
+# never the exact position; a location in a different cell is geocoded again
+MOVED_DEGREES = 0.5
+
+
+def grid_cell(latitude, longitude):
+    """Coarse [row, col] grid cell for a location."""
+    return [round(latitude / MOVED_DEGREES), round(longitude / MOVED_DEGREES)]
+
+
+def country_codes(coordinates):
+    """
+    Reverse geocodes a batch of (latitude, longitude) pairs in one call.
+    Returns the country codes in the same order, e.g. ["US", "GB"].
+    """
+    if not coordinates:
+        return []
+    results = rg.search([(lat, lon) for lat, lon in coordinates])
+    return [result.get("cc") for result in results]
+
+
+def price_for_country(country_code, price_table):
+    """
+    Looks up a price ID by country code, then by the country's region,
+    then falls back to the table's "default" entry.
+    """
+    if country_code in price_table:
+        return price_table[country_code]
+    region = COUNTRY_REGIONS.get(country_code)
+    if region in price_table:
+        return price_table[region]
+    return price_table.get("default")
+
+
+def resolve_price_ids(coordinates, price_table):
+    """Returns one price ID per (latitude, longitude) pair, geocoding them in a single batch."""
+    return [price_for_country(cc, price_table) for cc in country_codes(coordinates)]
+
+
+def _is_cached(telegram_id_str, latitude, longitude):
+    cached = COUNTRY_CACHE.get(telegram_id_str)
+    return bool(cached) and cached.get("cell") == grid_cell(latitude, longitude)
+
+
+def resolve_user_country_codes(users):
+    """
+    Takes (telegram_id, latitude, longitude) tuples and returns {telegram_id (str): country code}.
+    Users still in their cached grid cell skip geocoding; the rest are geocoded together.
+    """
+    stale = [(str(tid), lat, lon) for tid, lat, lon in users if not _is_cached(str(tid), lat, lon)]
+    if stale:
+        codes = country_codes([(lat, lon) for _, lat, lon in stale])
+        for (tid, lat, lon), cc in zip(stale, codes):
+            COUNTRY_CACHE[tid] = {"cc": cc, "cell": grid_cell(lat, lon)}
+    return {str(tid): COUNTRY_CACHE[str(tid)]["cc"] for tid, _, _ in users}
+
+
+def resolve_user_price_ids(users, price_table):
+    """Like resolve_user_country_codes, but maps each country through the price table."""
+    return {
+        tid: price_for_country(cc, price_table)
+        for tid, cc in resolve_user_country_codes(users).items()
+    }
+
+
+def resolve_price_id(telegram_id, latitude, longitude, price_table):
+    """Single-user version of resolve_user_price_ids."""
+    return resolve_user_price_ids([(telegram_id, latitude, longitude)], price_table)[str(telegram_id)]
@@ -0,0 +1,142 @@
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+# All opt-in: nothing below runs unless LOOP_STALL_THRESHOLD is set or
+# the profiler is switched on (admin endpoint / SIGUSR1).
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0"))  # seconds, 0 = off
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))  # seconds between samples
+
+
+def enable_stall_detection(loop, threshold=LOOP_STALL_THRESHOLD):
+    """
+    Turns on asyncio debug mode so any callback slower than `threshold`
+    is logged, and starts a watchdog thread that prints the loop thread's
+    stack while it is stuck. Returns the watchdog, or None when disabled.
+    """
+    if threshold <= 0:
+        return None
+    loop.set_debug(True)
+    loop.slow_callback_duration = threshold
+    watchdog = StallWatchdog(loop, threshold)
+    watchdog.start()
+    print(f"🩺 Stall detection on (threshold {threshold}s)")
+    return watchdog
+
+
+class StallWatchdog:
+    """
+    The loop bumps a heartbeat every threshold/2 seconds; if the heartbeat
+    goes stale, the loop is blocked and we dump where it is stuck.
+    """
+
+    def __init__(self, loop, threshold):
+        self.loop = loop
+        self.threshold = threshold
+        self.last_beat = time.monotonic()
+        self.loop_thread_id = None
+        self.reported = False
+
+    def start(self):
+        self.loop.call_soon_threadsafe(self._beat)
+        threading.Thread(target=self._watch, name="stall-watchdog", daemon=True).start()
+
+    def _beat(self):
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.reported = False
+        self.loop.call_later(self.threshold / 2, self._beat)
+
+    def _watch(self):
+        while not self.loop.is_closed():
+            time.sleep(self.threshold / 2)
+            stalled_for = time.monotonic() - self.last_beat
+            if stalled_for < self.threshold or self.reported or self.loop_thread_id is None:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            self.reported = True
+            stack = "".join(traceback.format_stack(frame))
+            print(f"🐢 Event loop blocked for {stalled_for:.2f}s, currently at:\n{stack}")
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's stack on a background thread and writes them in
+    collapsed-stack format ("frame;frame;frame count"), which flamegraph.pl
+    and speedscope read directly.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL, output_dir=PROFILE_DIR):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.samples = Counter()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.started_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.samples = Counter()
+        self.stop_event.clear()
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self.thread.start()
+        print(f"🔬 Profiler started (every {self.interval}s)")
+
+    def stop(self):
+        """Stops sampling and returns the path of the written profile."""
+        if not self.running:
+            return None
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        return self._write()
+
+    def toggle(self):
+        """Starts the profiler, or stops it and returns the profile path."""
+        with self.lock:
+            if self.running:
+                return self.stop()
+            self.start()
+            return None
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self.stop_event.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def _write(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{int(self.started_at)}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"🔬 Profiler stopped, {sum(self.samples.values())} samples written to {path}")
+        return path
+
+
+profiler = SamplingProfiler()
@@ -3,6 +3,7 @@ import pickle
 from datetime import datetime
 
 import gspread
+from gspread.utils import a1_to_rowcol
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 
@@ -15,6 +16,15 @@ CREDENTIALS_PATH = "client_secret_telegram.json"
 SHEET_NAME = "DMOSubSheetTelegram"  # The name of your Google Sheet workbook
 SHEET_TAB = "Master"                    # The sheet/tab name (if you have multiple)
 
+# "Master" tab layout. Row 1 may hold headers but doesn't have to: rows
+# without a numeric Telegram ID in column C are skipped everywhere.
+#   A Name  B Phone  C TelegramID  D DateStarted  E SubType  F ActiveStatus
+#   G SweepResult - last outcome written by sweeper.py, cleared whenever F is written
+
+# Telegram ID (str) -> sheet row number. Rows can be inserted or deleted by
+# hand, so find_row checks a cached row still holds that ID before using it.
+ROW_INDEX = {}
+
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive"
@@ -62,22 +72,119 @@ def add_data_to_sheet(sheet, data_list):
     """
     Appends a row to the bottom of the sheet.
     data_list example:
-      [Name, Phone, TelegramID, DateStarted, NextBilling, SubType, ActiveStatus]
+      [Name, Phone, TelegramID, DateStarted, SubType, ActiveStatus]
     """
     print(f"Adding row to sheet: {data_list}")
-    sheet.append_row(data_list, value_input_option="RAW")
+    response = sheet.append_row(data_list, value_input_option="RAW")
+    # updatedRange looks like "Master!A12:F12"; remember the new row number
+    try:
+        updated_range = response["updates"]["updatedRange"]
+        first_cell = updated_range.split("!")[-1].split(":")[0]
+        row, _ = a1_to_rowcol(first_cell)
+        ROW_INDEX[str(data_list[2])] = row
+    except Exception:
+        pass
+
+def find_row(sheet, telegram_id_str):
+    """
+    Returns the row number for a Telegram ID in column C (3), or None.
+    Checks the ROW_INDEX guess with a one-cell read and only falls back to
+    a full-column sheet.find if it's missing or stale.
+    """
+    row = ROW_INDEX.get(telegram_id_str)
+    if row:
+        if (sheet.acell(f"C{row}").value or "").strip() == telegram_id_str:
+            return row
+        print(f"Cached row {row} no longer holds Telegram ID '{telegram_id_str}', searching column C")
+        ROW_INDEX.pop(telegram_id_str, None)
+    cell = sheet.find(telegram_id_str, in_column=3)  # column C = 3
+    if cell:
+        ROW_INDEX[telegram_id_str] = cell.row
+        return cell.row
+    return None
+
+def write_status(sheet, row, new_status):
+    """
+    Sets the Active Status (column F) of a row and clears its SweepResult
+    (column G) in one call, so the sweeper looks at the row again.
+    """
+    sheet.update(values=[[new_status, ""]], range_name=f"F{row}:G{row}")
+    print(f"Updated row {row} column F to '{new_status}'")
 
 def update_data_in_sheet(sheet, telegram_id_str, new_status):
     """
     Finds the row with the matching Telegram ID in column C (3)
-    and updates the Active Status in column G (7).
+    and updates the Active Status in column F (6).
     """
     print(f"Updating row for Telegram ID '{telegram_id_str}' to status '{new_status}'")
-    cell = sheet.find(telegram_id_str, in_column=3)  # column C = 3
-    if cell:
-        row = cell.row
-        # Column G = 7
-        sheet.update_cell(row, 6, new_status)
-        print(f"Updated row {row} column 6 to '{new_status}'")
+    row = find_row(sheet, telegram_id_str)
+    if row:
+        write_status(sheet, row, new_status)
     else:
         print(f"No matching Telegram ID '{telegram_id_str}' found in column C.")
+
+def fetch_row_count(sheet):
+    """
+    Returns the sheet's current grid size from fresh metadata.
+    sheet.row_count is cached locally and gspread bumps it on every append,
+    even when the row landed in existing blank grid, so it can overcount.
+    """
+    return sheet.spreadsheet.worksheet(sheet.title).row_count
+
+def iter_telegram_ids(sheet, statuses, chunk_size=500):
+    """
+    Yields lists of Telegram IDs whose Active Status (column F) is in `statuses`,
+    reading columns C and F `chunk_size` rows at a time so the whole sheet
+    never has to be loaded at once. Ranges never go past the last grid row,
+    which the Sheets API would reject, and reading stops at the first chunk
+    that ends in blank rows.
+    """
+    row_count = fetch_row_count(sheet)
+    start = 1
+    while start <= row_count:
+        end = min(start + chunk_size - 1, row_count)
+        id_values, status_values = sheet.batch_get([f"C{start}:C{end}", f"F{start}:F{end}"])
+        chunk = []
+        for offset, id_cells in enumerate(id_values):
+            telegram_id_str = id_cells[0].strip() if id_cells else ""
+            status = status_values[offset][0] if offset < len(status_values) and status_values[offset] else ""
+            if telegram_id_str.isdigit():
+                ROW_INDEX[telegram_id_str] = start + offset
+                if status in statuses:
+                    chunk.append(telegram_id_str)
+        yield chunk
+        # The API drops trailing blank rows, so a short chunk means the data ended
+        if len(id_values) < end - start + 1:
+            return
+        start = end + 1
+
+def find_rows_by_status(sheet, statuses, settled_prefixes=()):
+    """
+    Reads columns C, F and G in one request and returns (row, telegram_id_str)
+    for every row whose Active Status (column F) is in `statuses`, leaving out
+    rows whose SweepResult (column G) starts with one of `settled_prefixes`.
+    """
+    id_values, status_values, result_values = sheet.batch_get(["C:C", "F:F", "G:G"])
+    rows = []
+    for offset, id_cells in enumerate(id_values):
+        telegram_id_str = id_cells[0].strip() if id_cells else ""
+        status = status_values[offset][0] if offset < len(status_values) and status_values[offset] else ""
+        result = result_values[offset][0] if offset < len(result_values) and result_values[offset] else ""
+        if settled_prefixes and result.startswith(tuple(settled_prefixes)):
+            continue
+        if telegram_id_str.isdigit() and status in statuses:
+            ROW_INDEX[telegram_id_str] = offset + 1
+            rows.append((offset + 1, telegram_id_str))
+    return rows
+
+def write_column_values(sheet, column, values_by_row):
+    """
+    Writes {row: value} into one column with a single batch_update call.
+    """
+    if not values_by_row:
+        return
+    sheet.batch_update([
+        {"range": f"{column}{row}", "values": [[value]]}
+        for row, value in values_by_row.items()
+    ])
+    print(f"Wrote {len(values_by_row)} value(s) to column {column}")
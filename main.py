@@ -1,7 +1,9 @@
 # main.py
 import asyncio
+import hmac
 import json
 import os
+import signal
 import time
 from datetime import datetime
 from threading import Thread
@@ -17,9 +19,14 @@ from telegram import (Bot, ChatJoinRequest, ChatPermissions, KeyboardButton,
 from telegram.ext import (Application, CallbackContext, CommandHandler,
                           MessageHandler, filters)
 
-from checks import check_if_in_usa
+from broadcast import create_broadcast, run_broadcast, unfinished_broadcasts
+from checks import COUNTRY_CACHE, resolve_price_id
+from diagnostics import enable_stall_detection, profiler
 # Import Google Sheets helpers
-from google_sheets import add_data_to_sheet, init_sheet, update_data_in_sheet
+from google_sheets import (ROW_INDEX, add_data_to_sheet, find_row, init_sheet,
+                           update_data_in_sheet, write_status)
+from state_store import load_snapshot, save_snapshot
+from sweeper import SWEEP_INTERVAL_HOURS, SWEEP_STATE, sweep_forever
 
 # ------------------------------------------------------------------------------
 # 1) LOAD ENV & CONFIG
@@ -30,6 +37,19 @@ STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_KEY")
 STRIPE_PRICE_ID_MONTHLY = os.getenv("STRIPE_PRICE_ID_MONTHLY")
 STRIPE_PRICE_ID_YEARLY = os.getenv("STRIPE_PRICE_ID_YEARLY")
+# Country code or region (see checks.COUNTRY_REGIONS) -> Stripe price ID.
+# US gets the yearly plan, everyone else monthly, unless STRIPE_PRICE_TABLE
+# (JSON, e.g. '{"GB": "price_...", "EU": "price_..."}') says otherwise.
+PRICE_TABLE = {"US": STRIPE_PRICE_ID_YEARLY, "default": STRIPE_PRICE_ID_MONTHLY}
+PRICE_TABLE.update(json.loads(os.getenv("STRIPE_PRICE_TABLE", "{}")))
+# Heroku sends SIGTERM and kills the dyno 30s later; finish up well before that
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "20"))
+# Required in the X-Admin-Token header for /admin/* routes; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Comma-separated Telegram IDs allowed to use admin commands like /broadcast
+ADMIN_TELEGRAM_IDS = {
+    int(tid) for tid in os.getenv("ADMIN_TELEGRAM_IDS", "").split(",") if tid.strip()
+}
 
 
 chat_id = os.getenv("CHANNEL_ID")
@@ -43,6 +63,18 @@ bot = bot_app.bot
 
 # GLOBAL to store the main event loop used by the bot
 MAIN_LOOP = None
+# Set once SIGTERM arrives so new webhooks are bounced back to Stripe for retry
+SHUTTING_DOWN = False
+
+# Hot state, persisted across restarts by state_store
+# Telegram ID (str) -> Stripe subscription ID
+SUBSCRIPTION_INDEX = {}
+# Telegram ID (str) -> {"price_id", "url", "expires_at"} of their last checkout link
+SESSION_CACHE = {}
+# job_id -> ({"kind", "user_id"}, asyncio.Task) for bot work still in flight
+PENDING_JOBS = {}
+# broadcast_id -> asyncio.Task; broadcasts checkpoint to disk themselves
+BROADCAST_TASKS = {}
 
 shortener_object = pyshorteners.Shortener()
 # Initialize Flask
@@ -81,8 +113,8 @@ async def location_handler(update: Update, context: CallbackContext):
 
     user_id = update.message.from_user.id
     print(f"User ID: {user_id} requested subscription")
-    monthly = check_if_in_usa(latitude=latitude, longitude=longitude)
-    await send_stripe_link(bot, user_id, monthly)
+    price_id = resolve_price_id(user_id, latitude, longitude, PRICE_TABLE)
+    await send_stripe_link(bot, user_id, price_id)
 
 
 async def start(update: Update, context: CallbackContext):
@@ -120,22 +152,21 @@ async def cancel(update: Update, context: CallbackContext):
     print(f"User ID: {user_id} requested cancellation")
 
     try:
-        subscriptions = stripe.Subscription.list(limit=200)
-        for subscription in subscriptions.auto_paging_iter():
-            if subscription.metadata.get('telegram_id') == user_id_str:
-                # schedule end-of-billing cancellation
-                stripe.Subscription.modify(
-                    subscription.id,
-                    cancel_at_period_end=True
-                )
-                # Mark them in the sheet
-                update_data_in_sheet(sheet, user_id_str, "Cancel at Period End")
-
-                await update.message.reply_text(
-                    "Your subscription will remain active until the end "
-                    "of your current billing period, then be canceled automatically. If you are still in your trial period then you will not be charged."
-                )
-                return
+        subscription = find_subscription(user_id_str)
+        if subscription:
+            # schedule end-of-billing cancellation
+            stripe.Subscription.modify(
+                subscription.id,
+                cancel_at_period_end=True
+            )
+            # Mark them in the sheet
+            update_data_in_sheet(sheet, user_id_str, "Cancel at Period End")
+
+            await update.message.reply_text(
+                "Your subscription will remain active until the end "
+                "of your current billing period, then be canceled automatically. If you are still in your trial period then you will not be charged."
+            )
+            return
         # If no subscription found
         await update.message.reply_text(
             "No active subscription found. If you still need help, contact an admin."
@@ -147,14 +178,63 @@ async def cancel(update: Update, context: CallbackContext):
         )
         print(f"Error on cancellation: {e}")
 
+def find_subscription(telegram_id_str):
+    """
+    Returns the user's live Stripe subscription, or None.
+    Tries SUBSCRIPTION_INDEX first and only pages through Stripe on a miss.
+    """
+    subscription_id = SUBSCRIPTION_INDEX.get(telegram_id_str)
+    if subscription_id:
+        subscription = stripe.Subscription.retrieve(subscription_id)
+        if (subscription.metadata.get('telegram_id') == telegram_id_str
+                and subscription.status != "canceled"):
+            return subscription
+        SUBSCRIPTION_INDEX.pop(telegram_id_str, None)
+
+    subscriptions = stripe.Subscription.list(limit=200)
+    for subscription in subscriptions.auto_paging_iter():
+        subscription_tid = subscription.metadata.get('telegram_id')
+        if subscription_tid:
+            # Newest first, so keep the first one seen for each user
+            SUBSCRIPTION_INDEX.setdefault(subscription_tid, subscription.id)
+        if subscription_tid == telegram_id_str:
+            return subscription
+    return None
+
+async def broadcast_command(update: Update, context: CallbackContext):
+    """
+    /broadcast <text> (admins only): sends <text> to every active subscriber.
+    """
+    user_id = update.message.from_user.id
+    if user_id not in ADMIN_TELEGRAM_IDS:
+        return
+    text = update.message.text.partition(" ")[2].strip()
+    if not text:
+        await update.message.reply_text("Usage: /broadcast <message>")
+        return
+    broadcast_id = start_broadcast(create_broadcast(text))
+    await update.message.reply_text(f"📣 Broadcast {broadcast_id} started.")
+
 # ------------------------------------------------------------------------------
 # 3) ASYNC BOT FUNCTIONS
 # ------------------------------------------------------------------------------
 
 
-async def send_stripe_link(bot: Bot, user_id: int, monthly: bool):
+async def send_stripe_link(bot: Bot, user_id: int, price_id: str):
     """Sends user a Stripe checkout link."""
-    price_id = STRIPE_PRICE_ID_MONTHLY if monthly  else STRIPE_PRICE_ID_YEARLY
+    # Reuse their previous checkout link if it has a while left before expiring
+    cached = SESSION_CACHE.get(str(user_id))
+    if cached and cached["price_id"] == price_id and cached["expires_at"] - time.time() > 600:
+        try:
+            await bot.send_message(
+                user_id,
+                    f"Yes bro cmonn, Click here to subscribe 👊🏿 : {cached['url']}"
+            )
+            print(f"✅ Re-sent cached Stripe subscription link to Telegram ID: {user_id}")
+        except Exception as e:
+            print(f"❌ Error sending Stripe link: {e}")
+        return
+
     try:
         checkout_session = stripe.checkout.Session.create(
             payment_method_types=['card'],
@@ -174,6 +254,11 @@ async def send_stripe_link(bot: Bot, user_id: int, monthly: bool):
             print("error shortening link: {e}")
             short_link = checkout_session.url
 
+        SESSION_CACHE[str(user_id)] = {
+            "price_id": price_id,
+            "url": short_link,
+            "expires_at": checkout_session.expires_at,
+        }
 
         await bot.send_message(
             user_id,
@@ -207,12 +292,88 @@ async def remove_user(bot: Bot, user_id: int):
     except Exception as e:
         print(f"⚠️ Error removing user {user_id}: {e}")
 
+# Bot work that must survive a restart, keyed by the name stored in snapshots
+JOB_HANDLERS = {
+    "remove_user": remove_user,
+    "invite_user": invite_user_to_group,
+}
+
+def schedule_job(kind: str, user_id: int):
+    """
+    Starts a JOB_HANDLERS job on the bot loop and tracks it in PENDING_JOBS
+    until it finishes. Must be called from MAIN_LOOP.
+    """
+    job_id = f"{kind}:{user_id}:{time.time_ns()}"
+    task = bot_app.create_task(JOB_HANDLERS[kind](bot, user_id))
+    PENDING_JOBS[job_id] = ({"kind": kind, "user_id": user_id}, task)
+
+    def job_done(finished_task):
+        # Cancelled jobs stay pending so they get written to the snapshot
+        if not finished_task.cancelled():
+            PENDING_JOBS.pop(job_id, None)
+
+    task.add_done_callback(job_done)
+
+async def drain_pending_jobs(timeout: float):
+    """Waits up to `timeout` seconds for pending jobs, then cancels the rest."""
+    tasks = [task for _, task in PENDING_JOBS.values()]
+    if not tasks:
+        return
+    print(f"⏳ Waiting on {len(tasks)} pending job(s)...")
+    _, still_running = await asyncio.wait(tasks, timeout=timeout)
+    for task in still_running:
+        task.cancel()
+    if still_running:
+        await asyncio.gather(*still_running, return_exceptions=True)
+        print(f"💾 {len(still_running)} job(s) unfinished, keeping them for next boot")
+
+def start_broadcast(broadcast_id: str):
+    """Runs (or resumes) a broadcast on the bot loop. Must be called from MAIN_LOOP."""
+    task = bot_app.create_task(run_broadcast(bot, sheet, broadcast_id))
+    BROADCAST_TASKS[broadcast_id] = task
+    task.add_done_callback(lambda _: BROADCAST_TASKS.pop(broadcast_id, None))
+    return broadcast_id
+
+def snapshot_state():
+    """Collects the hot state that is worth carrying over to the next boot."""
+    return {
+        # Copy: sheet reads in worker threads may still be filling ROW_INDEX
+        "row_index": dict(ROW_INDEX),
+        "subscription_index": SUBSCRIPTION_INDEX,
+        "country_cache": COUNTRY_CACHE,
+        "session_cache": {
+            tid: session for tid, session in SESSION_CACHE.items()
+            if session["expires_at"] > time.time()
+        },
+        "last_sweep_at": SWEEP_STATE["last_run_at"],
+        "pending_jobs": [job for job, _ in PENDING_JOBS.values()],
+    }
+
+def restore_state(state):
+    """Loads a snapshot_state() dict back in and returns the jobs left pending."""
+    ROW_INDEX.update(state.get("row_index", {}))
+    SUBSCRIPTION_INDEX.update(state.get("subscription_index", {}))
+    # Only take grid-cell entries; older snapshots held exact coordinates
+    COUNTRY_CACHE.update({
+        tid: {"cc": entry["cc"], "cell": entry["cell"]}
+        for tid, entry in state.get("country_cache", {}).items() if "cell" in entry
+    })
+    SWEEP_STATE["last_run_at"] = state.get("last_sweep_at")
+    for tid, session in state.get("session_cache", {}).items():
+        if session["expires_at"] > time.time():
+            SESSION_CACHE[tid] = session
+    return [job for job in state.get("pending_jobs", []) if job.get("kind") in JOB_HANDLERS]
+
 # ------------------------------------------------------------------------------
 # 4) FLASK WEBHOOK
 # ------------------------------------------------------------------------------
 @app.route('/webhook', methods=['POST'])
 def stripe_webhook():
     """Handles Stripe subscription events & updates Google Sheets accordingly."""
+    if SHUTTING_DOWN:
+        # Non-2xx makes Stripe retry, by which point the new dyno is up
+        return jsonify({'error': 'shutting down'}), 503
+
     payload = request.data
     sig_header = request.headers.get("Stripe-Signature")
     print(f"\n[FLASK] Received webhook event. Payload: {payload}")
@@ -241,7 +402,7 @@ def stripe_webhook():
     def record_subscription_in_sheet(subscription):
         """
         Gathers subscription+customer data and adds a new row to the sheet:
-        [Name, Phone, TelegramID, DateStarted, NextBilling, SubType, ActiveStatus]
+        [Name, Phone, TelegramID, DateStarted, SubType, ActiveStatus]
         """
         customer_id = subscription.get("customer")
         customer = stripe.Customer.retrieve(customer_id)
@@ -253,22 +414,17 @@ def stripe_webhook():
         sub_type = "Subscription"
         active_status = "Active"
 
-        cell = sheet.find(telegram_id_str, in_column=3)  # column C = 3
-        if cell:
-            row = cell.row
-            # Column G = 7
-            sheet.update_cell(row, 6, active_status)
-            print(f"Updated row {row} column 6 to '{active_status}'")
+        row = find_row(sheet, telegram_id_str)
+        if row:
+            write_status(sheet, row, active_status)
         else:
             row_data = [f"{name} ({email})", phone, telegram_id_str, date_started, sub_type, active_status]
             add_data_to_sheet(sheet, row_data)
 
 
-        # columns: [Name, Phone, TelegramID, DateStarted, NextBilling, SubType, ActiveStatus]
-
 
     def update_subscription_in_sheet(new_status):
-        """Updates the G column to the new_status for the given telegram_id."""
+        """Updates the F column to the new_status for the given telegram_id."""
         update_data_in_sheet(sheet, telegram_id_str, new_status)
 
     # React to the event
@@ -277,7 +433,8 @@ def stripe_webhook():
         # Mark them "Cancelled", remove from group
         def handle_deleted():
             update_subscription_in_sheet("Cancelled")
-            bot_app.create_task(remove_user(bot, int(telegram_id_str)))
+            SUBSCRIPTION_INDEX.pop(telegram_id_str, None)
+            schedule_job("remove_user", int(telegram_id_str))
 
         MAIN_LOOP.call_soon_threadsafe(handle_deleted)
 
@@ -285,7 +442,7 @@ def stripe_webhook():
         # Mark them "Payment Failed", remove from group
         def handle_failed():
             update_subscription_in_sheet("Payment Failed")
-            bot_app.create_task(remove_user(bot, int(telegram_id_str)))
+            schedule_job("remove_user", int(telegram_id_str))
 
         MAIN_LOOP.call_soon_threadsafe(handle_failed)
 
@@ -301,7 +458,9 @@ def stripe_webhook():
         if billing_reason == "subscription_create":
             def handle_initial_payment():
                 record_subscription_in_sheet(subscription_obj)
-                bot_app.create_task(invite_user_to_group(bot, int(telegram_id_str)))
+                SUBSCRIPTION_INDEX[telegram_id_str] = subscription_id
+                SESSION_CACHE.pop(telegram_id_str, None)
+                schedule_job("invite_user", int(telegram_id_str))
             MAIN_LOOP.call_soon_threadsafe(handle_initial_payment)
 
 
@@ -313,6 +472,31 @@ def stripe_webhook():
 
     return "", 200
 
+def is_admin_request():
+    """True if the request carries the ADMIN_TOKEN."""
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+@app.route('/admin/profile', methods=['POST'])
+def toggle_profiler():
+    """Starts the sampling profiler, or stops it and reports where the profile went."""
+    if not is_admin_request():
+        return jsonify({'error': 'forbidden'}), 403
+    output = profiler.toggle()
+    return jsonify({'running': profiler.running, 'output': output}), 200
+
+@app.route('/admin/broadcast', methods=['POST'])
+def admin_broadcast():
+    """Starts a broadcast of the JSON body's "text" to every active subscriber."""
+    if not is_admin_request():
+        return jsonify({'error': 'forbidden'}), 403
+    text = (request.get_json(silent=True) or {}).get("text", "").strip()
+    if not text:
+        return jsonify({'error': 'text is required'}), 400
+    broadcast_id = create_broadcast(text)
+    MAIN_LOOP.call_soon_threadsafe(start_broadcast, broadcast_id)
+    return jsonify({'broadcast_id': broadcast_id}), 202
+
 def run_flask():
     """Runs Flask in a blocking call (but on a separate thread)."""
     port = int(os.environ.get("PORT", 5000))
@@ -323,9 +507,16 @@ def run_flask():
 # ------------------------------------------------------------------------------
 async def async_main():
     """Manually initialize & start the bot, then poll for updates."""
-    global MAIN_LOOP
+    global MAIN_LOOP, SHUTTING_DOWN
     MAIN_LOOP = asyncio.get_running_loop()
 
+    # Opt-in diagnostics: slow-callback/stall reporting, SIGUSR1 toggles the profiler
+    enable_stall_detection(MAIN_LOOP)
+    MAIN_LOOP.add_signal_handler(signal.SIGUSR1, profiler.toggle)
+
+    # 0) Warm restart: reload caches and unfinished jobs from the last run
+    resumed_jobs = restore_state(load_snapshot())
+
     # 1) Initialize
     await bot_app.initialize()
 
@@ -334,6 +525,7 @@ async def async_main():
     bot_app.add_handler(CommandHandler("subscribe", subscribe))
     bot_app.add_handler(MessageHandler(filters.LOCATION, location_handler))
     bot_app.add_handler(CommandHandler("cancel", cancel))
+    bot_app.add_handler(CommandHandler("broadcast", broadcast_command))
     # Example for auto-approve join requests:
     # from telegram.ext import ChatJoinRequestHandler
     # bot_app.add_handler(ChatJoinRequestHandler(approve_join_request))
@@ -345,12 +537,40 @@ async def async_main():
     await bot_app.updater.start_polling()
     print("🤖 Telegram Bot is running...")
 
-    # 5) Keep running until we set an event
+    for job in resumed_jobs:
+        print(f"♻️ Resuming {job['kind']} for Telegram ID: {job['user_id']}")
+        schedule_job(job["kind"], job["user_id"])
+    for broadcast_id in unfinished_broadcasts():
+        start_broadcast(broadcast_id)
+
+    # Periodically remove Cancelled / Payment Failed members the webhooks missed,
+    # picking up the schedule from the last run rather than sweeping at every boot
+    sweep_task = None
+    if SWEEP_INTERVAL_HOURS > 0:
+        sweep_task = bot_app.create_task(sweep_forever(bot, sheet, chat_id))
+
+    # 5) Keep running until Heroku (SIGTERM) or Ctrl+C (SIGINT) stops us
     stop_event = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        MAIN_LOOP.add_signal_handler(sig, stop_event.set)
     await stop_event.wait()
+    SHUTTING_DOWN = True
+    print("🛑 Shutdown requested, draining pending work...")
 
-    # 6) Shut down gracefully
+    # 6) Shut down gracefully: stop taking updates, finish or persist jobs, snapshot
     await bot_app.updater.stop()
+    # Broadcasts resume from their on-disk checkpoint and the sweeper keeps its
+    # schedule in the snapshot, so just stop them
+    background_tasks = list(BROADCAST_TASKS.values())
+    if sweep_task:
+        background_tasks.append(sweep_task)
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await drain_pending_jobs(SHUTDOWN_GRACE_SECONDS)
+    save_snapshot(snapshot_state())
+    if profiler.running:
+        profiler.stop()
     await bot_app.stop()
     await bot_app.shutdown()
 
@@ -0,0 +1,39 @@
+import asyncio
+import os
+
+# Telegram allows roughly 30 Bot API calls/second per bot. Every bulk job
+# (broadcasts, the sweeper) shares bot_api_limiter so together they stay under it,
+# leaving headroom for normal bot traffic.
+BOT_API_RATE = float(os.getenv("BOT_API_RATE", "25"))
+
+
+class RateLimiter:
+    """
+    Hands out evenly spaced send slots at `rate` per second.
+    pause() holds every caller back after a 429, so one flood error
+    doesn't turn into a storm of them.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_slot = 0.0
+        self.paused_until = 0.0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            slot = max(self.next_slot, self.paused_until, now)
+            self.next_slot = slot + self.interval
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            # A pause may have started while we were waiting for our slot
+            if loop.time() >= self.paused_until:
+                return
+
+    def pause(self, seconds):
+        loop = asyncio.get_running_loop()
+        self.paused_until = max(self.paused_until, loop.time() + seconds)
+
+
+bot_api_limiter = RateLimiter(BOT_API_RATE)
@@ -0,0 +1,256 @@
+import gzip
+import json
+import os
+import time
+from array import array
+from datetime import date
+
+# Local, column-oriented copy of the "Master" tab so analytics never touch
+# the Sheets quota the live bot depends on. Each column is one flat list;
+# dates are stored as ordinals and SubType/ActiveStatus as small integer
+# codes into a per-column dictionary, so scans are tight integer loops.
+SNAPSHOT_PATH = os.getenv("SHEET_SNAPSHOT_PATH", "sheet_snapshot.json.gz")
+# Version 1 also held Name/Phone; loading one gives an empty snapshot, so the
+# next sync rebuilds and overwrites it
+SNAPSHOT_VERSION = 2
+
+# Sheet columns C-F, in order. Name and Phone (A-B) are customer PII that no
+# query needs, so they are never fetched or stored.
+SHEET_COLUMNS = ("telegram_id", "date_started", "sub_type", "status")
+DICTIONARY_COLUMNS = ("sub_type", "status")
+# status_changed is not in the sheet: it's the day a sync first saw the row's status change
+DATE_COLUMNS = ("date_started", "status_changed")
+
+CHURN_STATUSES = ("Cancelled", "Payment Failed")
+
+
+def _to_ordinal(value):
+    try:
+        return date.fromisoformat(value.strip()).toordinal()
+    except (AttributeError, ValueError):
+        return 0
+
+
+class SheetSnapshot:
+    """
+    Snapshot position i holds sheet row i + 1. synced_rows and
+    last_update_time record how far the last sync got.
+    """
+
+    def __init__(self):
+        self.columns = {
+            "telegram_id": [],
+            "date_started": array("l"), "status_changed": array("l"),
+            "sub_type": array("H"), "status": array("H"),
+        }
+        self.dictionaries = {column: [] for column in DICTIONARY_COLUMNS}
+        self.last_update_time = None
+        self.synced_at = None
+
+    @property
+    def synced_rows(self):
+        return len(self.columns["telegram_id"])
+
+    def code(self, column, value):
+        """Dictionary code for a value, adding it if it's new."""
+        values = self.dictionaries[column]
+        if value not in values:
+            values.append(value)
+        return values.index(value)
+
+    def lookup(self, column, value):
+        """Dictionary code for a value, or None if it never appears."""
+        values = self.dictionaries[column]
+        return values.index(value) if value in values else None
+
+    def append_row(self, cells):
+        cells = list(cells) + [""] * (len(SHEET_COLUMNS) - len(cells))
+        for column, value in zip(SHEET_COLUMNS, cells):
+            if column in DICTIONARY_COLUMNS:
+                self.columns[column].append(self.code(column, value))
+            elif column in DATE_COLUMNS:
+                self.columns[column].append(_to_ordinal(value))
+            else:
+                self.columns[column].append(value)
+        self.columns["status_changed"].append(0)
+
+    def set_status(self, index, status, changed_on):
+        """Records a new status for row `index`; returns True if it actually changed."""
+        status_code = self.code("status", status)
+        if self.columns["status"][index] == status_code:
+            return False
+        self.columns["status"][index] = status_code
+        self.columns["status_changed"][index] = changed_on
+        return True
+
+    def save(self, path=SNAPSHOT_PATH):
+        payload = {
+            "version": SNAPSHOT_VERSION,
+            "last_update_time": self.last_update_time,
+            "synced_at": self.synced_at,
+            "dictionaries": self.dictionaries,
+            "columns": {column: list(values) for column, values in self.columns.items()},
+        }
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=SNAPSHOT_PATH):
+        """Loads a saved snapshot, or returns an empty one if there isn't a usable file."""
+        snapshot = cls()
+        if not os.path.exists(path):
+            return snapshot
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != SNAPSHOT_VERSION:
+            print(f"⚠️ Ignoring sheet snapshot with version {payload.get('version')}")
+            return snapshot
+        snapshot.last_update_time = payload["last_update_time"]
+        snapshot.synced_at = payload["synced_at"]
+        snapshot.dictionaries = payload["dictionaries"]
+        for column, values in payload["columns"].items():
+            existing = snapshot.columns[column]
+            snapshot.columns[column] = array(existing.typecode, values) if isinstance(existing, array) else values
+        return snapshot
+
+
+def sync(sheet, path=SNAPSHOT_PATH, full=False):
+    """
+    Brings the local snapshot up to date with as little Sheets traffic as possible:
+      - one Drive metadata call; if the sheet hasn't been modified, stop there
+      - otherwise one batch_get for columns C and F of rows already synced
+        (statuses are the only cells the bot edits in place), plus any rows
+        appended since if the grid has grown past them
+    If a Telegram ID in column C no longer matches the snapshot (rows were
+    inserted or deleted by hand), falls back to a full rebuild.
+    Pass full=True to rebuild from scratch. Returns the snapshot.
+    """
+    previous = SheetSnapshot.load(path)
+    snapshot = SheetSnapshot() if full else previous
+    last_update_time = sheet.spreadsheet.get_lastUpdateTime()
+    if snapshot.last_update_time == last_update_time:
+        print(f"Sheet unchanged since last sync ({last_update_time}), {snapshot.synced_rows} rows")
+        return snapshot
+
+    # Ranges past the last grid row are rejected, so size every read off the real grid
+    from google_sheets import fetch_row_count
+    row_count = fetch_row_count(sheet)
+    synced_rows = snapshot.synced_rows
+    if synced_rows > row_count:
+        print(f"Sheet shrank below {synced_rows} synced rows, rebuilding snapshot")
+        return _rebuild(sheet, path, previous)
+
+    today = date.today().toordinal()
+    changed = 0
+    new_rows = []
+    if synced_rows:
+        ranges = [f"C1:C{synced_rows}", f"F1:F{synced_rows}"]
+        if row_count > synced_rows:
+            ranges.append(f"C{synced_rows + 1}:F{row_count}")
+        values = sheet.batch_get(ranges)
+        id_values, status_values = values[0], values[1]
+        new_rows = values[2] if len(values) > 2 else []
+
+        for index in range(synced_rows):
+            id_cells = id_values[index] if index < len(id_values) else []
+            if (id_cells[0] if id_cells else "") != snapshot.columns["telegram_id"][index]:
+                print(f"Row {index + 1} no longer holds the same Telegram ID, rebuilding snapshot")
+                return _rebuild(sheet, path, previous)
+        for index in range(synced_rows):
+            cells = status_values[index] if index < len(status_values) else []
+            if snapshot.set_status(index, cells[0] if cells else "", today):
+                changed += 1
+    elif row_count:
+        new_rows = sheet.batch_get([f"C1:F{row_count}"])[0]
+
+    for cells in new_rows:
+        snapshot.append_row(cells)
+
+    snapshot.last_update_time = last_update_time
+    snapshot.synced_at = int(time.time())
+    snapshot.save(path)
+    print(f"Synced sheet snapshot: {len(new_rows)} new row(s), {changed} status change(s), {snapshot.synced_rows} rows total")
+    return snapshot
+
+
+def _rebuild(sheet, path, previous):
+    """
+    Full sync, then carries each Telegram ID's status_changed date over from
+    `previous` where its status is unchanged, so churn history survives.
+    """
+    snapshot = sync(sheet, path, full=True)
+    old = {}
+    for index, telegram_id in enumerate(previous.columns["telegram_id"]):
+        status = previous.dictionaries["status"][previous.columns["status"][index]]
+        old[telegram_id] = (status, previous.columns["status_changed"][index])
+
+    today = date.today().toordinal()
+    for index, telegram_id in enumerate(snapshot.columns["telegram_id"]):
+        if telegram_id not in old or not telegram_id.strip().isdigit():
+            continue
+        old_status, changed_on = old[telegram_id]
+        status = snapshot.dictionaries["status"][snapshot.columns["status"][index]]
+        snapshot.columns["status_changed"][index] = changed_on if status == old_status else today
+    snapshot.save(path)
+    return snapshot
+
+
+# ------------------------------------------------------------------------------
+# QUERIES
+# ------------------------------------------------------------------------------
+def _month(ordinal):
+    return date.fromordinal(ordinal).strftime("%Y-%m") if ordinal else "unknown"
+
+
+def _matching_rows(snapshot, status=None, sub_type=None):
+    """Indexes of subscriber rows (skipping headers/blanks) matching the filters."""
+    status_code = snapshot.lookup("status", status) if status else None
+    sub_type_code = snapshot.lookup("sub_type", sub_type) if sub_type else None
+    if (status and status_code is None) or (sub_type and sub_type_code is None):
+        return []
+    statuses = snapshot.columns["status"]
+    sub_types = snapshot.columns["sub_type"]
+    return [
+        index for index, telegram_id in enumerate(snapshot.columns["telegram_id"])
+        if telegram_id.strip().isdigit()
+        and (status_code is None or statuses[index] == status_code)
+        and (sub_type_code is None or sub_types[index] == sub_type_code)
+    ]
+
+
+def count(snapshot, status=None, sub_type=None):
+    """Number of subscribers, optionally filtered by status and/or sub type."""
+    return len(_matching_rows(snapshot, status, sub_type))
+
+
+def group_by(snapshot, key, status=None, sub_type=None):
+    """
+    Subscriber counts grouped by one of:
+      "status", "sub_type"  - the sheet values
+      "month"               - month of DateStarted
+      "churn_month"         - month a sync saw them move to Cancelled/Payment Failed;
+                              not the real cancellation date, and rows already
+                              churned at the first sync count as "unknown"
+    """
+    rows = _matching_rows(snapshot, status, sub_type)
+    if key in DICTIONARY_COLUMNS:
+        codes = snapshot.columns[key]
+        names = snapshot.dictionaries[key]
+        keys = (names[codes[index]] for index in rows)
+    elif key == "month":
+        dates = snapshot.columns["date_started"]
+        keys = (_month(dates[index]) for index in rows)
+    elif key == "churn_month":
+        churn_codes = {snapshot.lookup("status", s) for s in CHURN_STATUSES} - {None}
+        statuses = snapshot.columns["status"]
+        changed = snapshot.columns["status_changed"]
+        keys = (_month(changed[index]) for index in rows if statuses[index] in churn_codes)
+    else:
+        raise ValueError(f"Can't group by {key!r}")
+
+    groups = {}
+    for group in keys:
+        groups[group] = groups.get(group, 0) + 1
+    return dict(sorted(groups.items()))
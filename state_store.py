@@ -0,0 +1,58 @@
+import gzip
+import json
+import os
+import time
+
+# Where the hot-state snapshot lives between restarts
+SNAPSHOT_PATH = os.getenv("STATE_SNAPSHOT_PATH", "bot_state.json.gz")
+SNAPSHOT_VERSION = 1
+
+
+def warn_if_ephemeral(env_var, what):
+    """
+    Heroku starts every dyno from a fresh filesystem and has no persistent
+    disk, so anything written locally is gone after the daily restart.
+    Prints a warning when running on a dyno and `env_var` hasn't been set
+    to point `what` somewhere that survives.
+    """
+    if "DYNO" in os.environ and not os.getenv(env_var):
+        print(f"⚠️ {what} is on the dyno's ephemeral disk and won't survive a restart; point {env_var} at persistent storage")
+
+
+def save_snapshot(state, path=SNAPSHOT_PATH):
+    """
+    Writes the state dict to a gzipped JSON file.
+    Writes to a temp file first and renames it, so a kill mid-write
+    never leaves a half-written snapshot behind.
+    """
+    payload = {"version": SNAPSHOT_VERSION, "saved_at": int(time.time()), "state": state}
+    tmp_path = f"{path}.tmp"
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        print(f"💾 Saved state snapshot to {path}")
+    except Exception as e:
+        print(f"⚠️ Error saving state snapshot: {e}")
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """
+    Reads the snapshot written by save_snapshot.
+    Returns the state dict, or an empty dict if there is no usable snapshot.
+    """
+    warn_if_ephemeral("STATE_SNAPSHOT_PATH", "The state snapshot")
+    if not os.path.exists(path):
+        return {}
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+    except Exception as e:
+        print(f"⚠️ Error loading state snapshot: {e}")
+        return {}
+
+    if payload.get("version") != SNAPSHOT_VERSION:
+        print(f"⚠️ Ignoring state snapshot with version {payload.get('version')}")
+        return {}
+    print(f"♻️ Loaded state snapshot from {path} (saved at {payload.get('saved_at')})")
+    return payload.get("state", {})
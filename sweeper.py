@@ -0,0 +1,111 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from telegram import Bot, ChatMember
+from telegram.error import RetryAfter
+
+from google_sheets import find_rows_by_status, write_column_values
+from rate_limiter import RateLimiter, bot_api_limiter
+
+# Rows in these statuses should not be in the group any more
+SWEEP_STATUSES = ("Cancelled", "Payment Failed")
+SWEEP_INTERVAL_HOURS = float(os.getenv("SWEEP_INTERVAL_HOURS", "24"))  # 0 = off
+# Don't sweep sooner than this after boot, so it never piles onto resumed broadcasts
+SWEEP_MIN_DELAY_MINUTES = float(os.getenv("SWEEP_MIN_DELAY_MINUTES", "30"))
+SWEEP_WORKERS = int(os.getenv("SWEEP_WORKERS", "10"))
+# Column G holds the outcome of the last sweep for each row (see google_sheets.py)
+SWEEP_RESULT_COLUMN = "G"
+# Outcomes that stay true until the status changes (which clears column G):
+# invite links are single-use and expire in 48h, so these users can't rejoin
+SETTLED_OUTCOMES = ("Removed", "Not a member")
+MAX_ATTEMPTS = 5
+
+# Unix time of the last finished sweep; carried across restarts in the state snapshot
+SWEEP_STATE = {"last_run_at": None}
+
+
+async def _call(limiter: RateLimiter, method, *args):
+    """Calls a Bot method within the rate limit, waiting out flood control."""
+    for _ in range(MAX_ATTEMPTS):
+        await limiter.acquire()
+        try:
+            return await method(*args)
+        except RetryAfter as e:
+            print(f"⏳ Flood control, pausing sweep for {e.retry_after}s")
+            limiter.pause(e.retry_after)
+    raise RuntimeError("still flood limited after retries")
+
+
+async def sweep_member(bot: Bot, limiter: RateLimiter, chat_id, telegram_id_str: str):
+    """Removes one lapsed member if they are still in the group; returns the outcome."""
+    user_id = int(telegram_id_str)
+    try:
+        member = await _call(limiter, bot.get_chat_member, chat_id, user_id)
+        if member.status in (ChatMember.LEFT, ChatMember.BANNED) or (
+                member.status == ChatMember.RESTRICTED and not member.is_member):
+            return "Not a member"
+        if member.status in (ChatMember.ADMINISTRATOR, ChatMember.OWNER):
+            return "Skipped (admin)"
+        # Same call remove_user uses: kicks them without a permanent ban
+        await _call(limiter, bot.unban_chat_member, chat_id, user_id)
+        print(f"❌ Sweeper removed Telegram ID: {user_id} from Group {chat_id}")
+        return "Removed"
+    except Exception as e:
+        print(f"⚠️ Sweeper error for {user_id}: {e}")
+        return f"Error: {e}"
+
+
+async def run_sweep(bot: Bot, sheet, chat_id):
+    """
+    Finds every Cancelled / Payment Failed row not already settled in one sheet
+    read, removes any of them still in the group, and writes each outcome to
+    column G in one batch.
+    """
+    rows = await asyncio.to_thread(find_rows_by_status, sheet, SWEEP_STATUSES, SETTLED_OUTCOMES)
+    print(f"🧹 Sweeping {len(rows)} lapsed member(s)...")
+    # Two API calls per straggler (getChatMember + unban), paced with broadcasts
+    limiter = bot_api_limiter
+    semaphore = asyncio.Semaphore(SWEEP_WORKERS)
+    today = datetime.now().strftime('%Y-%m-%d')
+
+    async def sweep_row(row, telegram_id_str):
+        async with semaphore:
+            outcome = await sweep_member(bot, limiter, chat_id, telegram_id_str)
+        return row, f"{outcome} ({today})"
+
+    results = await asyncio.gather(*(sweep_row(row, tid) for row, tid in rows))
+    await asyncio.to_thread(write_column_values, sheet, SWEEP_RESULT_COLUMN, dict(results))
+
+    SWEEP_STATE["last_run_at"] = int(time.time())
+    removed = sum(1 for _, outcome in results if outcome.startswith("Removed"))
+    print(f"✅ Sweep finished: {removed} removed out of {len(rows)} checked")
+    return dict(results)
+
+
+def seconds_until_next_sweep(interval_hours=SWEEP_INTERVAL_HOURS):
+    """
+    Time to wait before the next sweep: whatever is left of the interval since
+    the last run, but never less than SWEEP_MIN_DELAY_MINUTES. If the last run
+    is unknown (no snapshot), that means one sweep shortly after boot.
+    """
+    min_delay = SWEEP_MIN_DELAY_MINUTES * 60
+    last_run_at = SWEEP_STATE["last_run_at"]
+    if last_run_at is None:
+        return min_delay
+    return max(min_delay, last_run_at + interval_hours * 3600 - time.time())
+
+
+async def sweep_forever(bot: Bot, sheet, chat_id, interval_hours=SWEEP_INTERVAL_HOURS):
+    """Runs run_sweep every `interval_hours` until cancelled."""
+    while True:
+        delay = seconds_until_next_sweep(interval_hours)
+        print(f"🧹 Next sweep in {delay / 60:.0f} minute(s)")
+        await asyncio.sleep(delay)
+        try:
+            await run_sweep(bot, sheet, chat_id)
+        except Exception as e:
+            print(f"⚠️ Sweep failed: {e}")
+            # Don't retry straight away after a failure
+            SWEEP_STATE["last_run_at"] = int(time.time())